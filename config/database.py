@@ -2,30 +2,78 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import declarative_base 
 from sqlalchemy.orm import sessionmaker
 from urllib.parse import quote_plus
+from functools import lru_cache
+from contextlib import contextmanager
 from loguru import logger
 import os
 
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = quote_plus(os.getenv("DB_PASSWORD"))  # encode special characters
-DB_HOST = os.getenv("DB_HOST", "localhost")
-DB_PORT = os.getenv("DB_PORT", "5432")
-DB_NAME = os.getenv("DB_NAME", "retail_db")
+@lru_cache(maxsize=1)
+def _cfg():
+    """Reads the database settings from the environment once per process."""
+    return {
+        "user": os.getenv("DB_USER"),
+        "password": quote_plus(os.getenv("DB_PASSWORD", "")),  # encode special characters
+        "host": os.getenv("DB_HOST", "localhost"),
+        "port": os.getenv("DB_PORT", "5432"),
+        "name": os.getenv("DB_NAME", "retail_db"),
+    }
 
-DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+def _database_url():
+    """Builds the connection URL from the environment settings."""
+    cfg = _cfg()
+    # psycopg2 is named explicitly: the loaders use its copy_expert for COPY
+    return f"postgresql+psycopg2://{cfg['user']}:{cfg['password']}@{cfg['host']}:{cfg['port']}/{cfg['name']}"
 
 # Create engine and session factory
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+@lru_cache(maxsize=1)
+def get_engine():
+    """
+    Returns the process-wide engine, creating it and its connection pool on first use.
+    The pool is sized explicitly and psycopg2 batches executemany calls into
+    multi-row statements instead of one round trip per row.
+    """
+    return create_engine(
+        _database_url(),
+        pool_size=20,
+        max_overflow=10,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+        pool_timeout=30,
+        executemany_mode='values_plus_batch',
+    )
+
+def __getattr__(name):
+    """
+    Keeps the module-level engine and DATABASE_URL names for importers
+    without creating them at import time
+    """
+    if name == "engine":
+        return get_engine()
+    if name == "DATABASE_URL":
+        return _database_url()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Sessions are bound per call in get_db, so importing this module opens no pool
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
 Base = declarative_base()
 
-def get_db():
-    """Yields a database session and ensures proper cleanup."""
-    db = SessionLocal()
+@contextmanager
+def get_db(bind=None):
+    """
+    Provides a database session for a unit of work: commits when the block
+    succeeds, rolls back and re-raises on error, and always returns the
+    connection to the pool.
+    bind selects another engine than the process-wide one.
+    """
+    db = SessionLocal(bind=bind if bind is not None else get_engine())
     try:
         logger.info("Yielding database session")
         yield db
-    except Exception as e:
+        db.commit()
+    except Exception:
         logger.exception("Error during DB session")
+        db.rollback()
+        raise
     finally:
         db.close()
         logger.info("Database session closed")
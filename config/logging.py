@@ -0,0 +1,19 @@
+import os
+from loguru import logger
+
+_configured = False
+
+def configure_logging():
+    """
+    Registers the pipeline's rotating log file sinks. Entry points call this once;
+    repeated calls are no-ops so a sink is never attached twice.
+    Records are written from a background thread (enqueue=True).
+    """
+    global _configured
+    if _configured:
+        return
+    
+    os.makedirs("logs", exist_ok=True)
+    logger.add("logs/ingestion.logs", rotation="500 KB", level="INFO", format=" {name} - {level} - {message}", enqueue=True)
+    logger.add("logs/pipeline.logs", rotation="500 KB", level="INFO", format="{time} - {name} - {level} = {message}", enqueue=True)
+    _configured = True
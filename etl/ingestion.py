@@ -1,32 +1,72 @@
 import os
+import csv
+import shutil
+from pathlib import Path
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv
 from loguru import logger
 from datetime import datetime
 from dotenv import load_dotenv
 
 
-os.makedirs("logs",exist_ok=True)
-logger.add("logs/ingestion.logs",rotation="500 KB",level="INFO", format=" {name} - {level} - {message}")
-
 load_dotenv()
 
+# The environment does not change during a run, so read it once per process
+DATA_SOURCE_PATH = os.getenv("DATA_SOURCE_PATH")
+
+# Directories are created on first write, not on every instantiation
+RAW_DATA_DIR = Path("data") / "raw"
+PROCESSED_DATA_DIR = Path("data") / "processed"
+
+# Column types of the retail sales source. Passing them to read_csv skips
+# type inference, and only these columns are read from the file. Dates are
+# kept as strings and parsed with their known format during cleaning;
+# Postal Code stays a string so codes are not turned into floats. The integer
+# columns use the nullable Int32 so a blank cell is read as missing (and
+# handled during cleaning) instead of failing the whole read
+RETAIL_SCHEMA = {
+    "Row ID": "Int32",
+    "Order ID": "str",
+    "Order Date": "str",
+    "Ship Date": "str",
+    "Ship Mode": "str",
+    "Customer ID": "str",
+    "Customer Name": "str",
+    "Segment": "str",
+    "Country": "str",
+    "City": "str",
+    "State": "str",
+    "Postal Code": "str",
+    "Region": "str",
+    "Product ID": "str",
+    "Category": "str",
+    "Sub-Category": "str",
+    "Product Name": "str",
+    "Sales": "float64",
+    "Quantity": "Int32",
+    "Discount": "float64",
+    "Profit": "float64",
+}
+
+# Same schema expressed as Arrow types for the multithreaded PyArrow reader
+_ARROW_TYPES = {"Int32": pa.int32(), "float64": pa.float64(), "str": pa.string()}
+RETAIL_ARROW_SCHEMA = {col: _ARROW_TYPES[dtype] for col, dtype in RETAIL_SCHEMA.items()}
+
 class DataIngestion:
     """
     Handles ingestion of retail sales data from CSV files
     """
     def __init__(self, source_path=None):
-        self.source_path = source_path or os.getenv("DATA_SOURCE_PATH")
-        self.raw_data_dir = os.path.join("data", "raw")
-        self.processed_data_dir = os.path.join("data", "processed")
-        
-        # Create directories if they don't exist
-        for dir_path in [self.raw_data_dir, self.processed_data_dir, "logs"]:
-            os.makedirs(dir_path, exist_ok=True)
+        self.source_path = source_path or DATA_SOURCE_PATH
+        self.raw_data_dir = RAW_DATA_DIR
+        self.processed_data_dir = PROCESSED_DATA_DIR
     
-    def extract_data(self):
+    def extract_data(self, chunk_rows=None):
         """
         Extracts data from the source CSV file
-        Returns a pandas DataFrame with the raw data
+        Returns a pandas DataFrame with the raw data, or a generator of
+        DataFrame chunks of at most chunk_rows rows when chunk_rows is set
         """
         try:
             logger.info(f"Starting data extraction from {self.source_path}")
@@ -36,36 +76,100 @@ class DataIngestion:
                 logger.error(f"Source file {self.source_path} does not exist")
                 return None
             
+            # Create timestamp for the extraction
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            raw_file_path = self.raw_data_dir / f"retail_sales_raw_{timestamp}.csv"
+            
+            # Archive the source file byte for byte; re-serializing the parsed
+            # DataFrame to CSV would double the I/O and stringify every value
+            self.raw_data_dir.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(self.source_path, raw_file_path)
+            logger.info(f"Raw data saved to {raw_file_path}")
+            
+            if chunk_rows:
+                return self._extract_chunks(chunk_rows)
+            
             # Read CSV file
-            df = pd.read_csv(self.source_path)
+            df = self._read_arrow_csv()
             
             # Log extraction statistics
             record_count = len(df)
             logger.info(f"Successfully extracted {record_count} records")
             
-            # Create timestamp for the extraction
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            
-            # Save raw data with timestamp
-            raw_file_path = os.path.join(self.raw_data_dir, f"retail_sales_raw_{timestamp}.csv")
-            df.to_csv(raw_file_path, index=False)
-            logger.info(f"Raw data saved to {raw_file_path}")
-            
             return df
             
         except Exception as e:
             logger.error(f"Error during data extraction: {str(e)}")
             raise
     
-    def run_ingestion(self):
+    def _read_arrow_csv(self):
+        """
+        Reads the whole source CSV with PyArrow's multithreaded parser,
+        restricted to the known retail columns and their types
+        """
+        # Arrow needs the column list up front; only ask for columns that exist
+        # (utf-8-sig strips a byte order mark, as both CSV parsers do)
+        with open(self.source_path, encoding='utf-8-sig', newline='') as f:
+            header = next(csv.reader(f), [])
+        columns = [col for col in header if col in RETAIL_ARROW_SCHEMA]
+        
+        table = pv.read_csv(
+            self.source_path,
+            read_options=pv.ReadOptions(use_threads=True, block_size=64 << 20),
+            convert_options=pv.ConvertOptions(
+                column_types={col: RETAIL_ARROW_SCHEMA[col] for col in columns},
+                include_columns=columns,
+                strings_can_be_null=True  # empty fields are missing, as with pandas
+            )
+        )
+        # self_destruct frees each Arrow column as soon as it is converted, so
+        # the table and the frame never both hold the whole file. Blocks are
+        # still consolidated (split_blocks would hand out zero-copy, read-only
+        # columns, and cleaning modifies the frame in place)
+        df = table.to_pandas(self_destruct=True)
+        del table
+        return df
+    
+    def _read_csv(self, **kwargs):
+        """
+        Reads the source CSV with the C parser, restricted to the known retail
+        columns and their types
+        """
+        return pd.read_csv(
+            self.source_path,
+            engine='c',
+            dtype=RETAIL_SCHEMA,
+            usecols=lambda col: col in RETAIL_SCHEMA,
+            **kwargs
+        )
+    
+    def _extract_chunks(self, chunk_rows):
+        """
+        Yields the source CSV in chunks so that only one chunk is held in memory
+        """
+        try:
+            record_count = 0
+            reader = self._read_csv(chunksize=chunk_rows)
+            for chunk in reader:
+                record_count += len(chunk)
+                yield chunk
+            
+            logger.info(f"Successfully extracted {record_count} records in chunks of {chunk_rows}")
+            
+        except Exception as e:
+            logger.error(f"Error during chunked data extraction: {str(e)}")
+            raise
+    
+    def run_ingestion(self, chunk_rows=None):
         """
         Orchestrates the data ingestion process
+        When chunk_rows is set, returns a generator of DataFrame chunks
         """
         try:
             logger.info("Starting data ingestion process")
             
             # Extract data from source
-            df = self.extract_data()
+            df = self.extract_data(chunk_rows=chunk_rows)
             if df is None:
                 logger.error("Data extraction failed. Aborting ingestion process.")
                 return None
@@ -79,6 +183,9 @@ class DataIngestion:
 
 
 if __name__ == "__main__":
+    from config.logging import configure_logging
+    configure_logging()
+    
     # Run ingestion as standalone script
     ingestion = DataIngestion()
     df = ingestion.run_ingestion()
@@ -1,22 +1,180 @@
-import os
 import logging
 import pandas as pd
-from sqlalchemy import inspect,text
-from config.database import engine,Base,get_db
-from models.schema import DimCustomer,DimDate,DimProduct,FactSales
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import inspect,text,select,Integer
+from config.database import Base,get_db,get_engine
+from models.schema import DimCustomer,DimDate,DimProduct,FactSales,IngestedSource
 from loguru import logger
 from sqlalchemy.dialects.postgresql import insert
 
-os.makedirs("logs",exist_ok=True)
-logger.add("logs/ingestion.logs",rotation="500 KB",level="INFO", format=" {name} - {level} - {message}")
+# Frames with at least this many rows are streamed with COPY instead of executemany
+COPY_THRESHOLD = 1000
+
+# COPY input is serialized this many rows at a time as the server consumes it
+COPY_CHUNK_ROWS = 50000
+
+# A fact load drops the secondary fact_sales indexes and rebuilds them once
+# afterwards, instead of updating them row by row, when the table is empty or
+# the new rows are at least this fraction of the rows it already holds
+INDEX_REBUILD_FRACTION = 0.2
+
+# Dimension tables in dimensional data: (name, model, key column)
+DIM_TABLES = [
+    ('dim_date', DimDate, 'date_id'),
+    ('dim_customer', DimCustomer, 'customer_id'),
+    ('dim_product', DimProduct, 'product_id')
+]
+
+# Fact columns that carry a dimension's natural key, replaced by that
+# dimension's surrogate key at load time: natural key -> (model, surrogate key)
+FACT_SURROGATE_KEYS = {
+    'customer_id': (DimCustomer, 'customer_sk'),
+    'product_id': (DimProduct, 'product_sk')
+}
+
+# Dimensions whose rows are fully determined by their key (a date_id is the
+# date itself): existing rows are left alone instead of being rewritten
+INSERT_ONLY_DIMS = {DimDate}
+
+def _build_dim_loader(table_model, key_column):
+    """
+    Precomputes what a dimension load needs for one table, so each call
+    only binds data: its column list, the executemany upsert statement and
+    the SQL for the COPY staging path
+    A surrogate primary key other than key_column is left to the database
+    """
+    table = table_model.__table__
+    columns = [col.name for col in table.columns if col.name == key_column or not col.primary_key]
+    update_cols = [col for col in columns if col != key_column]
+    
+    stmt = insert(table)
+    staging = f"{table.name}_staging"
+    column_list = ", ".join(columns)
+    
+    insert_only = table_model in INSERT_ONLY_DIMS
+    if insert_only:
+        # DO NOTHING skips known keys without writing a new row version;
+        # RETURNING counts the inserted rows, as rowcount is not reliable for
+        # batched executemany
+        upsert = stmt.on_conflict_do_nothing(index_elements=[key_column]).returning(table.c[key_column])
+        conflict_action = "DO NOTHING"
+    else:
+        upsert = stmt.on_conflict_do_update(
+            index_elements=[key_column],
+            set_={col: stmt.excluded[col] for col in update_cols}
+        )
+        set_clause = ", ".join(f"{col} = EXCLUDED.{col}" for col in update_cols)
+        conflict_action = f"DO UPDATE SET {set_clause}"
+    
+    return {
+        'columns': columns,
+        'insert_only': insert_only,
+        'upsert': upsert,
+        'staging': staging,
+        'create_staging': text(
+            f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS "
+            f"SELECT {column_list} FROM {table.name} WITH NO DATA"
+        ),
+        'merge_staging': text(
+            f"INSERT INTO {table.name} ({column_list}) SELECT {column_list} FROM {staging} "
+            f"ON CONFLICT ({key_column}) {conflict_action}"
+        ),
+        'drop_staging': text(f"DROP TABLE {staging}"),
+    }
+
+# Per-table loaders built once at import
+DIM_LOADERS = {model: _build_dim_loader(model, key_column) for _, model, key_column in DIM_TABLES}
+
+class _CsvChunkReader:
+    """
+    File-like COPY source that serializes a DataFrame to CSV one slice of
+    COPY_CHUNK_ROWS rows at a time as the cursor reads from it, so the whole
+    table is never held as one CSV string
+    """
+    def __init__(self, df, chunk_rows=COPY_CHUNK_ROWS):
+        self._chunks = (
+            df.iloc[start:start + chunk_rows].to_csv(index=False, header=False, na_rep='\\N')
+            for start in range(0, len(df), chunk_rows)
+        )
+        self._chunk = ''
+        self._pos = 0
+    
+    def read(self, size=-1):
+        # Hand out the current slice piece by piece; an empty string ends the COPY
+        if self._pos >= len(self._chunk):
+            self._chunk = next(self._chunks, '')
+            self._pos = 0
+        end = len(self._chunk) if size is None or size < 0 else self._pos + size
+        data = self._chunk[self._pos:end]
+        self._pos = end
+        return data
+
+class _DeferredIndexes:
+    """
+    Drops the secondary indexes of a table for a bulk load, at most once per
+    load, and rebuilds them when the caller has inserted its last rows
+    Loads that are small next to the table keep the indexes live: a rebuild
+    scans the whole table and holds an ACCESS EXCLUSIVE lock until commit
+    """
+    def __init__(self, table):
+        self.table = table
+        self._decided = False
+        self._dropped = []
+    
+    def defer(self, conn, new_rows):
+        """
+        Drops the indexes before the first insert if new_rows makes it a bulk load
+        Later calls are no-ops, so a streaming load decides on its first chunk
+        """
+        if self._decided:
+            return
+        self._decided = True
+        if not self._is_bulk_load(conn, new_rows):
+            return
+        
+        # DDL is transactional in PostgreSQL: if the load fails, the rollback
+        # restores the dropped indexes too
+        self._dropped = list(self.table.indexes)
+        for index in self._dropped:
+            index.drop(conn, checkfirst=True)
+        if self._dropped:
+            logger.info(f"Dropped {len(self._dropped)} {self.table.name} indexes for the bulk load")
+    
+    def rebuild(self, conn):
+        """
+        Recreates the indexes dropped by defer, if any
+        """
+        # One sorted build per index is far cheaper than per-row maintenance
+        for index in self._dropped:
+            index.create(conn)
+        if self._dropped:
+            logger.info(f"Rebuilt {len(self._dropped)} {self.table.name} indexes")
+        self._dropped = []
+    
+    def _is_bulk_load(self, conn, new_rows):
+        """
+        True when the table is empty or new_rows is at least
+        INDEX_REBUILD_FRACTION of the rows it already holds
+        """
+        if conn.execute(text(f"SELECT 1 FROM {self.table.name} LIMIT 1")).first() is None:
+            return True
+        
+        # The planner's row estimate avoids counting a large table; it is
+        # negative until the table is first analyzed, and then the indexes stay
+        existing_rows = conn.execute(
+            text("SELECT reltuples FROM pg_class WHERE oid = CAST(:name AS regclass)"),
+            {"name": self.table.name}
+        ).scalar()
+        return existing_rows is not None and existing_rows > 0 and new_rows >= INDEX_REBUILD_FRACTION * existing_rows
 
 class DataLoading:
     """
     Handles loading transformed data into the PostgreSQL database
     """
-    def __init__(self):
-        self.engine = engine
-        os.makedirs("logs", exist_ok=True)
+    def __init__(self, engine=None):
+        # The process-wide engine by default, so every run (including each
+        # scheduled one) draws from the same connection pool
+        self.engine = engine if engine is not None else get_engine()
     
     def create_tables(self):
         """
@@ -38,10 +196,88 @@ class DataLoading:
         except Exception as e:
             logger.error(f"Error creating database tables: {str(e)}")
             return False
+    
+    def source_loaded(self, fingerprint):
+        """
+        Returns True if a load of this source version has been committed to the
+        database; a recreated database has no record, so its first run loads
+        """
+        try:
+            with self.engine.connect() as conn:
+                if not inspect(conn).has_table(IngestedSource.__tablename__):
+                    return False
+                table = IngestedSource.__table__
+                return conn.execute(
+                    select(table.c.fingerprint).where(table.c.fingerprint == fingerprint)
+                ).first() is not None
+        except Exception as e:
+            logger.warning(f"Could not check the loaded source versions: {str(e)}")
+            return False
+    
+    def _record_source(self, fingerprint, db):
+        """
+        Records a source version as loaded, inside the caller's load transaction
+        so the record commits (or rolls back) together with the fact rows
+        """
+        stmt = insert(IngestedSource.__table__).values(fingerprint=fingerprint).on_conflict_do_nothing()
+        db.connection().execute(stmt)
+    
+    def _copy_dataframe(self, df, table_name, conn):
+        """
+        Streams a DataFrame into table_name with a single COPY ... FROM STDIN
+        on the raw psycopg2 connection, serializing it to CSV in slices while
+        the server consumes them
+        """
+        columns = ", ".join(df.columns)
+        raw_conn = conn.connection
+        with raw_conn.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {table_name} ({columns}) FROM STDIN WITH (FORMAT CSV, NULL '\\N')",
+                _CsvChunkReader(df)
+            )
+    
+    def _copy_frame(self, df, table_model):
+        """
+        Returns df with integer columns that picked up NaNs (and so became float)
+        restored to a nullable integer dtype, since COPY rejects '1.0' for INTEGER
+        """
+        columns = table_model.__table__.columns
+        int_cols = [
+            col.name for col in columns
+            if isinstance(col.type, Integer) and col.name in df.columns
+            and pd.api.types.is_float_dtype(df[col.name])
+        ]
+        if int_cols:
+            df = df.astype({col: 'Int64' for col in int_cols})
+        return df
+
+    def _records(self, df):
+        """
+        Builds executemany parameters from plain row tuples, which pandas yields
+        far more cheaply than the per-row dicts of DataFrame.to_dict
+        Missing values become None (SQL NULL); only columns that have any are touched
+        Nullable integer columns (e.g. Int32) are converted too, since their
+        tuples hold NumPy scalars that psycopg2 cannot adapt
+        """
+        nullable = [
+            col for col in df.columns
+            if df[col].hasnans or (
+                pd.api.types.is_extension_array_dtype(df[col]) and pd.api.types.is_integer_dtype(df[col])
+            )
+        ]
+        if nullable:
+            df = df.astype({col: object for col in nullable})
+            df[nullable] = df[nullable].where(df[nullable].notna(), None)
+        columns = list(df.columns)
+        return [dict(zip(columns, row)) for row in df.itertuples(index=False, name=None)]
 
-    def load_dimension_table(self, df, table_model, key_column):
+    def load_dimension_table(self, df, table_model, key_column, db):
         """
-        Loads data into a dimension table with conflict resolution (insert/update)
+        Loads data into a dimension table with conflict resolution in one
+        INSERT ... ON CONFLICT statement: an executemany batch for small frames,
+        or a merge from a COPY-filled staging table from COPY_THRESHOLD rows
+        Known keys are updated, or skipped (DO NOTHING) for INSERT_ONLY_DIMS
+        Runs inside the caller's session; committing is left to the caller
         """
         try:
             if df is None or df.empty:
@@ -50,46 +286,66 @@ class DataLoading:
             
             logger.info(f"Loading data into {table_model.__tablename__}")
             
-            # Get a database session
-            db = next(get_db())
+            # A key may appear more than once in the source (e.g. a customer seen in
+            # several cities); ON CONFLICT DO UPDATE cannot touch the same row twice
+            # in one statement, so keep the latest version of each key
+            record_count = len(df)
+            df = df.drop_duplicates(subset=[key_column], keep='last')
+            if len(df) < record_count:
+                logger.info(f"{record_count - len(df)} duplicate {key_column}s collapsed to their latest version")
+            table_name = table_model.__tablename__
+            loader = DIM_LOADERS[table_model]
+            df = df[loader['columns']]
             
-            # Convert DataFrame to list of dictionaries
-            records = df.to_dict('records')
+            # Plain Core statements run on the session's connection; nothing
+            # goes through the ORM unit of work or identity map
+            conn = db.connection()
             
-            # Track counts
-            insert_count = 0
-            update_count = 0
-            
-            # Process each record
-            for record in records:
-                # Use upsert to handle conflict resolution
-                stmt = insert(table_model).values(record)
-                stmt = stmt.on_conflict_do_nothing(index_elements=[key_column])
+            if len(df) >= COPY_THRESHOLD:
+                # COPY into a staging table, then upsert from it in one statement
+                conn.execute(loader['create_staging'])
+                self._copy_dataframe(self._copy_frame(df, table_model), loader['staging'], conn)
+                # A single INSERT ... SELECT reports its inserted rows in rowcount
+                inserted = conn.execute(loader['merge_staging']).rowcount
+                conn.execute(loader['drop_staging'])
                 
-                try:
-                    db.execute(stmt)
-                    insert_count += 1
-                except Exception as e:
-                    if 'psycopg2.errors.UniqueViolation' in str(e):
-                        logger.warning(f"Duplicate record found for {key_column}: {record[key_column]}. Skipping insert.")
-                    else:
-                        raise e
-            
-            db.commit()
-            logger.info(f"Loaded {table_model.__tablename__}: {insert_count} inserted, {update_count} updated")
-            return insert_count + update_count
+                self._log_dimension_load(table_name, loader, len(df), inserted, " via COPY")
+                return len(df)
+            
+            records = self._records(df)
+            
+            # Let the database resolve conflicts for the whole batch at once;
+            # a Core insert on the Table sends all records as one executemany
+            # without the ORM's per-mapping bulk-insert processing
+            result = conn.execute(loader['upsert'], records)
+            inserted = len(result.all()) if loader['insert_only'] else None
+            
+            self._log_dimension_load(table_name, loader, len(records), inserted)
+            return len(records)
             
         except Exception as e:
             logger.error(f"Error loading {table_model.__tablename__}: {str(e)}")
-            if 'db' in locals():
-                db.rollback()  # Rollback the transaction in case of error
-            return 0
+            raise
 
 
     
-    def load_fact_table(self, df):
+    def _log_dimension_load(self, table_name, loader, record_count, inserted, via=""):
+        """
+        Logs a dimension load: rows inserted and skipped for an insert-only
+        dimension, rows upserted otherwise
         """
-        Loads data into the fact table
+        if loader['insert_only']:
+            logger.info(f"Loaded {table_name}: {inserted} inserted, {record_count - inserted} skipped{via}")
+        else:
+            logger.info(f"Loaded {table_name}: {record_count} upserted{via}")
+    
+    def load_fact_table(self, df, db, batch_size=None, indexes=None):
+        """
+        Loads data into the fact table, in statements of at most batch_size rows
+        (all rows in one statement when batch_size is None)
+        Runs inside the caller's session; committing is left to the caller
+        indexes is the caller's _DeferredIndexes for fact_sales: it may drop
+        them before the inserts, and the caller rebuilds them after its last load
         """
         try:
             if df is None or df.empty:
@@ -98,44 +354,114 @@ class DataLoading:
             
             logger.info("Loading data into fact_sales")
             
-            # Get a database session
-            db = next(get_db())
+            # Plain Core statements run on the session's connection; nothing
+            # goes through the ORM unit of work or identity map
+            conn = db.connection()
+            fact_table = FactSales.__table__
             
-            # Convert DataFrame to list of dictionaries
-            records = df.to_dict('records')
+            # Fetch the row_ids that are already loaded in one query and
+            # keep only the new rows, instead of checking row by row
+            if 'row_id' in df.columns:
+                existing_ids = {
+                    row[0] for row in conn.execute(
+                        select(fact_table.c.row_id).where(fact_table.c.row_id.in_(df['row_id'].tolist()))
+                    )
+                }
+                df = df[~df['row_id'].isin(existing_ids)]
+                if existing_ids:
+                    logger.info(f"{len(existing_ids)} existing row_ids skipped")
             
-            # Process each record
-            insert_count = 0
-            for record in records:
-                # Check if record already exists by row_id
-                row_id = record.get('row_id')
-                if row_id:
-                    existing = db.query(FactSales).filter(FactSales.row_id == row_id).first()
-                    
-                    if existing:
-                        # Skip existing records to avoid duplicates
-                        continue
-                
-                # Create new fact record
-                new_record = FactSales(**record)
-                db.add(new_record)
-                insert_count += 1
+            if df.empty:
+                logger.info("Loaded fact_sales: 0 inserted")
+                return 0
+            
+            df = self._resolve_surrogate_keys(df, conn)
             
-            # Commit changes
-            db.commit()
+            # Decided on the rows left after the row_id filter, so re-sending
+            # rows that are already loaded does not count as a bulk load
+            if indexes is not None:
+                indexes.defer(conn, len(df))
+            
+            # Each batch is sent as one statement, COPY or executemany by its size
+            batch_size = batch_size or len(df)
+            insert_count = 0
+            for start in range(0, len(df), batch_size):
+                insert_count += self._insert_fact_batch(df.iloc[start:start + batch_size], conn)
             
             logger.info(f"Loaded fact_sales: {insert_count} inserted")
             return insert_count
             
         except Exception as e:
             logger.error(f"Error loading fact_sales: {str(e)}")
-            if 'db' in locals():
-                db.rollback()
-            return 0
+            raise
+    
+    def _resolve_surrogate_keys(self, df, conn):
+        """
+        Replaces the customer and product natural keys of fact rows with the
+        surrogate keys the database assigned when the dimensions were loaded,
+        looked up in one query per dimension
+        Raises ValueError for a key with no dimension row, as the foreign key
+        on the natural key would have rejected it, instead of loading a NULL
+        """
+        for natural_key, (table_model, surrogate_key) in FACT_SURROGATE_KEYS.items():
+            if natural_key not in df.columns:
+                continue
+            
+            table = table_model.__table__
+            rows = conn.execute(
+                select(table.c[natural_key], table.c[surrogate_key])
+                .where(table.c[natural_key].in_(df[natural_key].unique().tolist()))
+            ).all()
+            surrogate_ids = pd.Series(
+                [row[1] for row in rows], index=[row[0] for row in rows], dtype='int64'
+            )
+            
+            surrogates = df[natural_key].map(surrogate_ids)
+            unmapped = df[natural_key][surrogates.isna() & df[natural_key].notna()].unique()
+            if len(unmapped) > 0:
+                raise ValueError(
+                    f"{len(unmapped)} {natural_key} values have no row in {table.name}, "
+                    f"e.g. {list(unmapped[:5])}"
+                )
+            
+            df = df.assign(**{surrogate_key: surrogates}).drop(columns=natural_key)
+        return df
+    
+    def _insert_fact_batch(self, df, conn):
+        """
+        Inserts one batch of new fact rows and returns how many were inserted
+        """
+        fact_table = FactSales.__table__
+        
+        if len(df) >= COPY_THRESHOLD:
+            # Existing rows were filtered out by the caller, so COPY straight into the table
+            self._copy_dataframe(self._copy_frame(df, FactSales), fact_table.name, conn)
+            return len(df)
+        
+        records = self._records(df)
+        
+        # Bulk insert the rows; ON CONFLICT guards against rows inserted
+        # concurrently since load_fact_table's row_id lookup. rowcount is not
+        # reliable for batched executemany, so count the RETURNING rows
+        stmt = (
+            insert(fact_table)
+            .on_conflict_do_nothing(index_elements=['row_id'])
+            .returning(fact_table.c.row_id)
+        )
+        return len(conn.execute(stmt, records).all())
     
-    def run_loading(self, dimensional_data):
+    def _load_dimension_in_session(self, df, table_model, key_column):
+        """
+        Loads one dimension table in a session of its own, for use from a worker thread
+        """
+        with get_db(self.engine) as db:
+            return self.load_dimension_table(df, table_model, key_column, db)
+    
+    def run_loading(self, dimensional_data, batch_size=None, source_fingerprint=None):
         """
         Orchestrates the data loading process
+        batch_size caps the rows per fact insert statement
+        source_fingerprint, if given, is recorded as loaded with the fact rows
         """
         try:
             logger.info("Starting data loading workflow")
@@ -147,19 +473,27 @@ class DataLoading:
             
             # Load dimension tables first
             dim_tables = [
-                (dimensional_data.get('dim_date'), DimDate, 'date_id'),
-                (dimensional_data.get('dim_customer'), DimCustomer, 'customer_id'),
-                (dimensional_data.get('dim_product'), DimProduct, 'product_id')
+                (dimensional_data.get(name), model, key_column)
+                for name, model, key_column in DIM_TABLES
+                if dimensional_data.get(name) is not None
             ]
             
-            for df, model, key_column in dim_tables:
-                if df is not None:
-                    self.load_dimension_table(df, model, key_column)
+            # The dimensions do not reference each other, so load them concurrently,
+            # each in its own session and transaction; psycopg2 releases the GIL
+            # while waiting on the database, so the round trips overlap
+            if dim_tables:
+                with ThreadPoolExecutor(max_workers=len(dim_tables)) as executor:
+                    list(executor.map(lambda args: self._load_dimension_in_session(*args), dim_tables))
             
-            # Load fact table last
+            # Load fact table last, once every dimension it references has committed
             fact_df = dimensional_data.get('fact_sales')
-            if fact_df is not None:
-                self.load_fact_table(fact_df)
+            with get_db(self.engine) as db:
+                if fact_df is not None:
+                    indexes = _DeferredIndexes(FactSales.__table__)
+                    self.load_fact_table(fact_df, db, batch_size=batch_size, indexes=indexes)
+                    indexes.rebuild(db.connection())
+                if source_fingerprint is not None:
+                    self._record_source(source_fingerprint, db)
             
             logger.info("Data loading workflow completed successfully")
             return True
@@ -167,9 +501,63 @@ class DataLoading:
         except Exception as e:
             logger.error(f"Data loading workflow failed: {str(e)}")
             return False
+    
+    def run_streaming_loading(self, dimensional_chunks, batch_size=None, source_fingerprint=None):
+        """
+        Loads an iterator of per-chunk dimensional data in a single transaction,
+        so an error in any chunk rolls back the whole load
+        Dimension keys already loaded by an earlier chunk are not sent again
+        source_fingerprint, if given, is recorded as loaded in the same transaction
+        """
+        try:
+            logger.info("Starting streaming data loading workflow")
+            
+            # Create tables if they don't exist
+            if not self.create_tables():
+                logger.error("Failed to create database tables. Aborting loading process.")
+                return False
+            
+            seen_keys = {name: set() for name, _, _ in DIM_TABLES}
+            chunk_count = 0
+            
+            with get_db(self.engine) as db:
+                # Any index drop happens once, at the first chunk with new fact
+                # rows, and the rebuild once after the last chunk
+                indexes = _DeferredIndexes(FactSales.__table__)
+                for dimensional_data in dimensional_chunks:
+                    # Dimensions first so the chunk's fact rows can reference them
+                    for name, model, key_column in DIM_TABLES:
+                        df = dimensional_data.get(name)
+                        if df is None:
+                            continue
+                        
+                        df = df[~df[key_column].isin(seen_keys[name])]
+                        if not df.empty:
+                            self.load_dimension_table(df, model, key_column, db)
+                            seen_keys[name].update(df[key_column])
+                    
+                    fact_df = dimensional_data.get('fact_sales')
+                    if fact_df is not None:
+                        self.load_fact_table(fact_df, db, batch_size=batch_size, indexes=indexes)
+                    
+                    chunk_count += 1
+                
+                indexes.rebuild(db.connection())
+                if source_fingerprint is not None:
+                    self._record_source(source_fingerprint, db)
+            
+            logger.info(f"Streaming data loading workflow completed successfully ({chunk_count} chunks)")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Streaming data loading workflow failed: {str(e)}")
+            return False
 
 
 if __name__ == "__main__":
+    from config.logging import configure_logging
+    configure_logging()
+    
     # For testing the loading module directly
     from ingestion import DataIngestion
     from transforming import DataTransformation
@@ -1,71 +1,109 @@
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 from loguru import logger
-import os
 from datetime import datetime
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
-os.makedirs("logs",exist_ok=True)
-logger.add("logs/ingestion.logs",rotation="500 KB",level="INFO", format=" {name} - {level} - {message}")
+# Created on first write, not on every instantiation
+PROCESSED_DATA_DIR = Path("data") / "processed"
+
+# Day-first dates of the source extract (e.g. 08/11/2017); an explicit format
+# keeps to_datetime on its fast strptime path instead of inferring per call
+DATE_FORMAT = "%d/%m/%Y"
+
+# Processed outputs are columnar Parquet files
+PARQUET_COMPRESSION = "zstd"
+
+# Frames are converted to Arrow and written one row group of this many rows at
+# a time, so only one slice is ever duplicated in Arrow memory; row groups this
+# size also keep the min/max statistics selective for predicate pushdown
+PARQUET_ROW_GROUP_ROWS = 100000
 
 class DataTransformation:
     """
     Handles cleaning and transformation of retail sales data
     """
     def __init__(self):
-        self.processed_data_dir = os.path.join("data", "processed")
-        os.makedirs(self.processed_data_dir, exist_ok=True)
-        os.makedirs("logs", exist_ok=True)
+        self.processed_data_dir = PROCESSED_DATA_DIR
     
     def clean_data(self, df):
         """
         Cleans the data by handling missing values, duplicates, etc.
+        Works on df in place rather than on a copy: the caller hands over
+        ownership of the frame (see run_transformation)
         """
         try:
             logger.info("Starting data cleaning process")
             initial_records = len(df)
             
-            # Make a copy to avoid modifying the original dataframe
-            clean_df = df.copy()
-            
-            # Check for missing values
-            missing_values = clean_df.isnull().sum().sum()
-            logger.info(f"Found {missing_values} missing values")
-            
-            # Handle missing values
-            if missing_values > 0:
-                # For critical columns, we drop rows with missing values
-                critical_columns = ["Order ID", "Product ID", "Customer ID", "Sales"]
-                clean_df = clean_df.dropna(subset=critical_columns)
-                
-                # For non-critical columns, we fill missing values with appropriate defaults
-                # Numeric columns with 0
-                numeric_columns = clean_df.select_dtypes(include=['number']).columns
-                for col in numeric_columns:
-                    if col not in critical_columns:
-                        clean_df[col] = clean_df[col].fillna(0)
-                
-                # String columns with 'Unknown'
-                string_columns = clean_df.select_dtypes(include=['object']).columns
-                for col in string_columns:
-                    if col not in critical_columns:
-                        clean_df[col] = clean_df[col].fillna('Unknown')
-            
-            # Handle duplicates
-            duplicates = clean_df.duplicated().sum()
-            logger.info(f"Found {duplicates} duplicate records")
-            
-            if duplicates > 0:
-                clean_df = clean_df.drop_duplicates()
-            
-            # Convert date columns to datetime
-            date_columns = ["Order Date", "Ship Date"]
-            for col in date_columns:
-                if col in clean_df.columns:
-                    clean_df[col] = pd.to_datetime(clean_df[col], dayfirst=True, errors='coerce')
+            clean_df = df
+            
+            # Handle missing values; dropna and fillna are no-ops on a frame
+            # without any, so there is no separate full-frame count to gate them
+            # For critical columns, we drop rows with missing values
+            # ("Row ID" too when present: it is the record key de-duplicated on
+            # below, so a 0 filled into it would collapse every such row into one)
+            critical_columns = ["Order ID", "Product ID", "Customer ID", "Sales"]
+            if "Row ID" in clean_df.columns:
+                critical_columns.append("Row ID")
+            clean_df.dropna(subset=critical_columns, inplace=True)
+            # This runs once per chunk when streaming, so the log calls here pass
+            # their values as arguments: loguru formats them only when a sink
+            # accepts the level
+            logger.info("Dropped {} records with missing critical values", initial_records - len(clean_df))
+            
+            # Keep text in Arrow string buffers rather than Python str objects;
+            # frames from the Arrow CSV reader already are, others may still hold
+            # object columns
+            dtypes = clean_df.dtypes
+            object_columns = dtypes.index[dtypes == object]
+            if len(object_columns) > 0:
+                clean_df[object_columns] = clean_df[object_columns].astype("string[pyarrow]")
+            
+            # For non-critical columns, we fill missing values with appropriate defaults:
+            # numeric columns with 0, string columns with 'Unknown', in a single pass
+            # (columns are classified from the one dtypes read above; the object
+            # columns among them have just become strings)
+            fill_values = {}
+            for col, dtype in dtypes.items():
+                if col in critical_columns:
+                    continue
+                if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+                    fill_values[col] = 0
+                elif pd.api.types.is_string_dtype(dtype):
+                    fill_values[col] = 'Unknown'
+            clean_df.fillna(value=fill_values, inplace=True)
+            
+            # Handle duplicates on the record key only ("Row ID" is unique per
+            # source row; otherwise an order line is one product in one order),
+            # instead of hashing every column of every row. The count comes from
+            # the length change rather than from a second duplicated() pass
+            if "Row ID" in clean_df.columns:
+                record_key = ["Row ID"]
+            else:
+                record_key = ["Order ID", "Product ID"]
+            records_before_dedup = len(clean_df)
+            clean_df.drop_duplicates(subset=record_key, inplace=True)
+            logger.info("Removed {} duplicate records", records_before_dedup - len(clean_df))
+            
+            # Convert date columns to datetime, parsing all of them in one
+            # to_datetime call so its cache of repeated strings spans every column
+            date_columns = [col for col in ["Order Date", "Ship Date"] if col in clean_df.columns]
+            if date_columns:
+                parsed = pd.to_datetime(
+                    pd.concat([clean_df[col] for col in date_columns], ignore_index=True),
+                    format=DATE_FORMAT, errors='coerce'
+                ).to_numpy()
+                record_count = len(clean_df)
+                for i, col in enumerate(date_columns):
+                    clean_df[col] = parsed[i * record_count:(i + 1) * record_count]
             
             # Log cleaning statistics
             final_records = len(clean_df)
-            logger.info(f"Data cleaning completed. Records: {initial_records} -> {final_records}")
+            logger.info("Data cleaning completed. Records: {} -> {}", initial_records, final_records)
             
             return clean_df
             
@@ -76,51 +114,77 @@ class DataTransformation:
     def transform_data(self, df):
         """
         Transforms the data by creating derived features, normalizing, etc.
+        Returns df with the derived columns added; the existing columns are
+        shared with df, not copied
         """
         try:
             logger.info("Starting data transformation process")
             
-            # Make a copy to avoid modifying the original dataframe
-            transform_df = df.copy()
+            transform_df = df
+            columns = transform_df.columns
+            
+            # Derived columns are collected here and added in one assign at the
+            # end, instead of inserting (and re-blocking) them one at a time
+            new_cols = {}
             
             # Extract date components for date dimension
-            if "Order Date" in transform_df.columns:
-                transform_df["Order Year"] = transform_df["Order Date"].dt.year
-                transform_df["Order Month"] = transform_df["Order Date"].dt.month
-                transform_df["Order Day"] = transform_df["Order Date"].dt.day
-                transform_df["Order Quarter"] = transform_df["Order Date"].dt.quarter
-                transform_df["Order Day of Week"] = transform_df["Order Date"].dt.dayofweek
-                transform_df["Order Is Weekend"] = transform_df["Order Day of Week"].apply(lambda x: 1 if x >= 5 else 0)
-            
-            if "Ship Date" in transform_df.columns:
-                transform_df["Ship Year"] = transform_df["Ship Date"].dt.year
-                transform_df["Ship Month"] = transform_df["Ship Date"].dt.month
-                transform_df["Ship Day"] = transform_df["Ship Date"].dt.day
+            # (the .dt accessor is looked up once per column and reused)
+            if "Order Date" in columns:
+                order_dt = transform_df["Order Date"].dt
+                new_cols["Order Year"] = self._narrow(order_dt.year, "int16")
+                new_cols["Order Month"] = self._narrow(order_dt.month, "int8")
+                new_cols["Order Day"] = self._narrow(order_dt.day, "int8")
+                new_cols["Order Quarter"] = self._narrow(order_dt.quarter, "int8")
+                new_cols["Order Day of Week"] = self._narrow(order_dt.dayofweek, "int8")
+                new_cols["Order Is Weekend"] = (new_cols["Order Day of Week"] >= 5).astype("int8")
+            
+            if "Ship Date" in columns:
+                ship_dt = transform_df["Ship Date"].dt
+                new_cols["Ship Year"] = self._narrow(ship_dt.year, "int16")
+                new_cols["Ship Month"] = self._narrow(ship_dt.month, "int8")
+                new_cols["Ship Day"] = self._narrow(ship_dt.day, "int8")
             
             # Calculate shipping duration in days
-            if "Order Date" in transform_df.columns and "Ship Date" in transform_df.columns:
-                transform_df["Shipping Duration"] = (transform_df["Ship Date"] - transform_df["Order Date"]).dt.days
+            if "Order Date" in columns and "Ship Date" in columns:
+                # One subtraction on the raw datetime64[D] buffers, no intermediate timedelta Series
+                order_days = transform_df["Order Date"].to_numpy().astype("datetime64[D]")
+                ship_days = transform_df["Ship Date"].to_numpy().astype("datetime64[D]")
+                duration = ship_days - order_days
+                missing = np.isnat(duration)
+                if missing.any():
+                    # Rows with an unparsed date get NaN, as .dt.days gave
+                    shipping_duration = duration.astype("int64").astype("float64")
+                    shipping_duration[missing] = np.nan
+                else:
+                    shipping_duration = duration.astype("int32")
+                new_cols["Shipping Duration"] = shipping_duration
             
             # Calculate profit if sales column exists (assuming standard 20% margin if profit not available)
-            if "Sales" in transform_df.columns and "Profit" not in transform_df.columns:
-                transform_df["Profit"] = transform_df["Sales"] * 0.2
+            if "Sales" in columns and "Profit" not in columns:
+                new_cols["Profit"] = transform_df["Sales"] * 0.2
             
             # Calculate profit margin
-            if "Sales" in transform_df.columns and "Profit" in transform_df.columns:
-                # Avoid division by zero
-                transform_df["Profit Margin"] = np.where(
-                    transform_df["Sales"] > 0,
-                    transform_df["Profit"] / transform_df["Sales"],
-                    0
+            if "Sales" in columns and ("Profit" in columns or "Profit" in new_cols):
+                sales = transform_df["Sales"].to_numpy(dtype="float64")
+                profit = (new_cols["Profit"] if "Profit" in new_cols else transform_df["Profit"]).to_numpy(dtype="float64")
+                # Avoid division by zero: divide only where sales > 0 and leave
+                # the zeros elsewhere, in one pass with no inf/NaN intermediates
+                new_cols["Profit Margin"] = np.divide(
+                    profit, sales,
+                    out=np.zeros_like(sales),
+                    where=sales > 0
                 )
             
             # Add a default quantity of 1 if not present
-            if "Quantity" not in transform_df.columns:
-                transform_df["Quantity"] = 1
+            if "Quantity" not in columns:
+                new_cols["Quantity"] = 1
             
             # Add a default discount of 0 if not present
-            if "Discount" not in transform_df.columns:
-                transform_df["Discount"] = 0.0
+            if "Discount" not in columns:
+                new_cols["Discount"] = 0.0
+            
+            # assign shares the existing columns' data rather than copying it
+            transform_df = transform_df.assign(**new_cols)
             
             logger.info("Data transformation completed successfully")
             return transform_df
@@ -139,11 +203,15 @@ class DataTransformation:
             
             # Create dimension tables
             
+            # Dimension rows are de-duplicated on their key alone, keeping the
+            # latest version of each key as loading does; hashing one ID column
+            # is far cheaper than hashing every string column of every row
+            
             # Customer dimension
             if all(col in df.columns for col in ["Customer ID", "Customer Name"]):
                 dim_customer = df[["Customer ID", "Customer Name", "Segment", 
                                   "Country", "City", "State", 
-                                  "Postal Code", "Region"]].drop_duplicates()
+                                  "Postal Code", "Region"]].drop_duplicates(subset=["Customer ID"], keep='last')
                 dim_customer.columns = [col.lower().replace(" ", "_") for col in dim_customer.columns]
             else:
                 logger.warning("Customer dimension columns not found in dataframe")
@@ -151,7 +219,7 @@ class DataTransformation:
             
             # Product dimension
             if all(col in df.columns for col in ["Product ID", "Product Name"]):
-                dim_product = df[["Product ID", "Category", "Sub-Category", "Product Name"]].drop_duplicates()
+                dim_product = df[["Product ID", "Category", "Sub-Category", "Product Name"]].drop_duplicates(subset=["Product ID"], keep='last')
                 dim_product.columns = [col.lower().replace(" ", "_").replace("-", "_") for col in dim_product.columns]
             else:
                 logger.warning("Product dimension columns not found in dataframe")
@@ -165,34 +233,36 @@ class DataTransformation:
                 date_columns.append("Ship Date")
             
             if date_columns:
-                # Create unified date dimension with all unique dates
-                all_dates = pd.DataFrame()
-                for col in date_columns:
-                    dates = pd.DataFrame({
-                        'date': pd.Series(df[col].unique()).dt.date
-                    })
-                    all_dates = pd.concat([all_dates, dates])
-                
-                dim_date = all_dates.drop_duplicates().reset_index(drop=True)
+                # Create unified date dimension with all unique dates: one
+                # concatenate and one sorted unique over datetime64[D] values,
+                # skipping dates that failed to parse
+                all_dates = np.unique(np.concatenate([
+                    df[col].dropna().to_numpy().astype('datetime64[D]') for col in date_columns
+                ]))
+                dim_date = pd.DataFrame({'date': all_dates})
                 
-                # Add date attributes
-                date_series = pd.to_datetime(dim_date['date'])
-                dim_date['day'] = date_series.dt.day
-                dim_date['month'] = date_series.dt.month
-                dim_date['year'] = date_series.dt.year
-                dim_date['quarter'] = date_series.dt.quarter
-                dim_date['day_of_week'] = date_series.dt.dayofweek
-                dim_date['is_weekend'] = dim_date['day_of_week'].apply(lambda x: 1 if x >= 5 else 0)
+                # Add date attributes, straight from the datetime64[D] values:
+                # day numbers since 1970-01-01 (a Thursday) and month/year truncation
+                day_numbers = all_dates.astype('int64')
+                month_starts = all_dates.astype('datetime64[M]')
+                months = month_starts.astype('int64') % 12 + 1
+                dim_date['day'] = ((all_dates - month_starts).astype('int64') + 1).astype('int8')
+                dim_date['month'] = months.astype('int8')
+                dim_date['year'] = (all_dates.astype('datetime64[Y]').astype('int64') + 1970).astype('int16')
+                dim_date['quarter'] = ((months - 1) // 3 + 1).astype('int8')
+                dim_date['day_of_week'] = ((day_numbers + 3) % 7).astype('int8')  # Monday=0
+                dim_date['is_weekend'] = (dim_date['day_of_week'] >= 5).astype('int8')
                 
-                # Add date_id as auto-incrementing primary key
-                dim_date['date_id'] = range(1, len(dim_date) + 1)
+                # date_id is the date itself as YYYYMMDD, so every run and every
+                # chunk of a stream derives the same key without any lookup
+                dim_date['date_id'] = self._date_ids(dim_date['date'])
             else:
                 logger.warning("Date dimension columns not found in dataframe")
                 dim_date = None
             
             # Create fact table
             fact_columns = ["Row ID", "Order ID", "Customer ID", "Product ID", 
-                           "Ship Mode", "Sales", "Quantity", "Discount", "Profit", "Profit Margin"]
+                           "Ship Mode", "Sales", "Quantity", "Discount", "Profit"]
             
             available_columns = [col for col in fact_columns if col in df.columns]
             fact_sales = df[available_columns].copy()
@@ -200,18 +270,20 @@ class DataTransformation:
             # Convert column names to snake_case
             fact_sales.columns = [col.lower().replace(" ", "_") for col in fact_sales.columns]
             
-            # Add date keys by joining with dim_date if available
+            # Ship mode has a handful of distinct values: keep it as category codes
+            # rather than one string per fact row (Parquet stores it dictionary-encoded)
+            if "ship_mode" in fact_sales.columns:
+                fact_sales["ship_mode"] = fact_sales["ship_mode"].astype("category")
+            
+            # Add date keys (the same YYYYMMDD ids as dim_date) if dim_date is available
             if dim_date is not None:
-                # Create date mapping dictionaries
-                date_map = dict(zip(dim_date['date'], dim_date['date_id']))
-                
                 # Map order_date to order_date_id
                 if "Order Date" in df.columns:
-                    fact_sales['order_date_id'] = df["Order Date"].dt.date.map(date_map)
+                    fact_sales['order_date_id'] = self._date_ids(df["Order Date"])
                 
                 # Map ship_date to ship_date_id
                 if "Ship Date" in df.columns:
-                    fact_sales['ship_date_id'] = df["Ship Date"].dt.date.map(date_map)
+                    fact_sales['ship_date_id'] = self._date_ids(df["Ship Date"])
             
             logger.info("Dimensional data preparation completed successfully")
             
@@ -226,9 +298,26 @@ class DataTransformation:
             logger.error(f"Error during dimensional data preparation: {str(e)}")
             raise
     
+    def _narrow(self, values, dtype):
+        """
+        Downcasts a date-part column to a small integer dtype, unless dates that
+        failed to parse left NaNs in it (then it stays float64)
+        """
+        return values if values.hasnans else values.astype(dtype)
+    
+    def _date_ids(self, dates):
+        """
+        Returns the YYYYMMDD date_id of each value of a datetime column, as int32
+        Dates that failed to parse (NaT) get NaN
+        """
+        parts = dates.dt
+        return parts.year * 10000 + parts.month * 100 + parts.day
+    
     def run_transformation(self, df):
         """
         Orchestrates the data transformation process
+        Takes ownership of df: cleaning modifies it in place and transformation
+        builds on its data without copying it
         """
         try:
             logger.info("Starting data transformation workflow")
@@ -244,18 +333,7 @@ class DataTransformation:
             
             # Save transformed data
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            
-            # Save the full transformed dataset
-            transformed_path = os.path.join(self.processed_data_dir, f"retail_sales_transformed_{timestamp}.csv")
-            transformed_df.to_csv(transformed_path, index=False)
-            logger.info(f"Transformed data saved to {transformed_path}")
-            
-            # Save dimensional tables
-            for table_name, table_df in dimensional_data.items():
-                if table_df is not None:
-                    table_path = os.path.join(self.processed_data_dir, f"{table_name}_{timestamp}.csv")
-                    table_df.to_csv(table_path, index=False)
-                    logger.info(f"{table_name} saved to {table_path}")
+            self.save_outputs(transformed_df, dimensional_data, timestamp)
             
             logger.info("Data transformation workflow completed successfully")
             return dimensional_data
@@ -263,9 +341,123 @@ class DataTransformation:
         except Exception as e:
             logger.error(f"Data transformation workflow failed: {str(e)}")
             return None
-
+    
+    def iter_transformation(self, chunks):
+        """
+        Streams the transformation over an iterator of raw DataFrame chunks,
+        yielding the dimensional data of each chunk as soon as it is ready
+        clean_data de-duplicates within a chunk only
+        """
+        try:
+            logger.info("Starting streaming data transformation workflow")
+            
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            writers = {}
+            
+            try:
+                for chunk in chunks:
+                    cleaned_df = self.clean_data(chunk)
+                    transformed_df = self.transform_data(cleaned_df)
+                    dimensional_data = self.prepare_dimensional_data(transformed_df)
+                    
+                    # Append each chunk to this run's processed files
+                    self.save_outputs(transformed_df, dimensional_data, timestamp, writers=writers)
+                    
+                    yield dimensional_data
+            finally:
+                for writer in writers.values():
+                    writer.close()
+            
+            logger.info("Streaming data transformation workflow completed successfully")
+            
+        except Exception as e:
+            logger.error(f"Streaming data transformation workflow failed: {str(e)}")
+            raise
+    
+    def save_outputs(self, transformed_df, dimensional_data, timestamp, writers=None):
+        """
+        Saves the transformed dataset and the dimensional tables to the processed
+        data directory as Parquet files
+        With a writers dict (path -> open ParquetWriter), rows are appended to the
+        files of a streaming run instead; the caller closes the writers
+        fact_sales is written as a dataset directory partitioned by order year/month
+        """
+        self.processed_data_dir.mkdir(parents=True, exist_ok=True)
+        
+        # The full transformed dataset plus the dimensional tables
+        outputs = [("retail_sales_transformed", transformed_df)] + [
+            (table_name, table_df) for table_name, table_df in dimensional_data.items()
+            if table_df is not None
+        ]
+        
+        def save(output):
+            table_name, table_df = output
+            if table_name == "fact_sales" and "order_date_id" in table_df.columns:
+                table_path = self.processed_data_dir / f"{table_name}_{timestamp}"
+                self._write_partitioned(table_df, table_path, writers)
+            else:
+                table_path = self.processed_data_dir / f"{table_name}_{timestamp}.parquet"
+                self._write_parquet(table_df, table_path, writers)
+            logger.info("{} saved to {}", table_name, table_path)
+        
+        # Each output goes to its own file and pyarrow releases the GIL while
+        # encoding and writing, so the writes overlap
+        with ThreadPoolExecutor(max_workers=len(outputs)) as executor:
+            list(executor.map(save, outputs))
+    
+    def _write_parquet(self, df, path, writers=None):
+        """
+        Writes df to a zstd-compressed Parquet file in row groups of
+        PARQUET_ROW_GROUP_ROWS, or appends them through the streaming run's
+        writer for path, which then stays open
+        """
+        writer = writers.get(path) if writers is not None else None
+        try:
+            # An empty frame still writes one (empty) row group, so the file exists
+            for start in range(0, max(len(df), 1), PARQUET_ROW_GROUP_ROWS):
+                table = pa.Table.from_pandas(df.iloc[start:start + PARQUET_ROW_GROUP_ROWS], preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema, compression=PARQUET_COMPRESSION)
+                    if writers is not None:
+                        writers[path] = writer
+                else:
+                    # Later slices may infer a looser type for a column (e.g. an
+                    # id column that picked up a NaN); conform them to the file's schema
+                    table = table.cast(writer.schema)
+                writer.write_table(table)
+        finally:
+            if writers is None and writer is not None:
+                writer.close()
+    
+    def _write_partitioned(self, df, root, writers=None):
+        """
+        Writes fact rows to a Parquet dataset under root, split into
+        order_year=/order_month= directories derived from order_date_id, so a
+        reader filtering on a period only opens that period's files
+        Each partition is one file; with a writers dict, the chunks of a stream
+        are appended to it through that partition's open writer
+        """
+        # The partition values live only in the directory names, so they stay
+        # out of the stored columns; rows whose order date failed to parse go
+        # to order_year=0/order_month=0
+        periods = df["order_date_id"].fillna(0).astype("int32").to_numpy() // 100
+        period_values, period_index = np.unique(periods, return_inverse=True)
+        
+        # Rows are grouped by period once, then each period's rows go through
+        # _write_parquet, which converts them to Arrow one row group at a time
+        order = np.argsort(period_index, kind="stable")
+        bounds = np.cumsum(np.bincount(period_index, minlength=len(period_values)))
+        for period, positions in zip(period_values, np.split(order, bounds[:-1])):
+            partition_dir = root / f"order_year={period // 100}" / f"order_month={period % 100}"
+            partition_dir.mkdir(parents=True, exist_ok=True)
+            # The file name is fixed per run, like the unpartitioned outputs: a
+            # rerun within the same second replaces the file instead of adding to it
+            self._write_parquet(df.iloc[positions], partition_dir / "part-0.parquet", writers)
 
 if __name__ == "__main__":
+    from config.logging import configure_logging
+    configure_logging()
+    
     # For testing the transformation module directly
     from ingestion import DataIngestion
     
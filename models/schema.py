@@ -1,4 +1,4 @@
-from sqlalchemy import Column,String,Integer,Float,Date,ForeignKey
+from sqlalchemy import Column,String,Integer,Float,Date,DateTime,ForeignKey,Index,Computed,func
 from sqlalchemy.orm import relationship
 from config.database import Base
 
@@ -6,7 +6,9 @@ class DimCustomer(Base):
     """dimension table for customer information"""
     __tablename__ = "dim_customer"
 
-    customer_id = Column(String, primary_key=True)
+    # Integer surrogate key; the source's customer ID stays unique as the natural key
+    customer_sk = Column(Integer, primary_key=True, autoincrement=True)
+    customer_id = Column(String(16), unique=True, nullable=False)  # e.g. CG-12520
     customer_name = Column(String,nullable=True)
     segment = Column(String)
     country = Column(String)
@@ -25,7 +27,9 @@ class DimProduct(Base):
     """Dimension table for Product information"""
     __tablename__ = "dim_product"
     
-    product_id = Column(String, primary_key=True)
+    # Integer surrogate key; the source's product ID stays unique as the natural key
+    product_sk = Column(Integer, primary_key=True, autoincrement=True)
+    product_id = Column(String(32), unique=True, nullable=False)  # e.g. FUR-BO-10001798
     category = Column(String)
     sub_category = Column(String)
     product_name = Column(String, nullable=False)
@@ -42,7 +46,8 @@ class DimDate(Base):
     """Dimension table for Date information"""
     __tablename__ = "dim_date"
     
-    date_id = Column(Integer, primary_key=True, autoincrement=True)
+    # The date as YYYYMMDD (e.g. 20171108), computed by the transformation
+    date_id = Column(Integer, primary_key=True, autoincrement=False)
     date = Column(Date, unique=True, nullable=False)
     day = Column(Integer)
     month = Column(Integer)
@@ -70,11 +75,13 @@ class FactSales(Base):
     row_id = Column(Integer, primary_key=True)
     order_id = Column(String, nullable=False)
     
-    # Foreign keys to dimension tables
-    customer_id = Column(String, ForeignKey("dim_customer.customer_id"))
-    product_id = Column(String, ForeignKey("dim_product.product_id"))
+    # Foreign keys to dimension tables (integer surrogate keys keep fact rows narrow)
+    # Each is indexed so star-schema joins and filters do not scan the fact table
+    # (order_date_id through the covering index below, which leads with it)
+    customer_sk = Column(Integer, ForeignKey("dim_customer.customer_sk"), index=True)
+    product_sk = Column(Integer, ForeignKey("dim_product.product_sk"), index=True)
     order_date_id = Column(Integer, ForeignKey("dim_date.date_id"))
-    ship_date_id = Column(Integer, ForeignKey("dim_date.date_id"))
+    ship_date_id = Column(Integer, ForeignKey("dim_date.date_id"), index=True)
     
     # Additional attributes
     ship_mode = Column(String)
@@ -82,7 +89,9 @@ class FactSales(Base):
     quantity = Column(Integer)
     discount = Column(Float)
     profit = Column(Float)
-    profit_margin = Column(Float)
+    # Stored generated column: the database derives it from profit and sales,
+    # so it is never sent by the loader (same zero-sales rule as the transformation)
+    profit_margin = Column(Float, Computed("CASE WHEN sales > 0 THEN profit / sales ELSE 0 END", persisted=True))
     
     # Relationships with dimension tables
     customer = relationship("DimCustomer", back_populates="sales")
@@ -90,6 +99,27 @@ class FactSales(Base):
     order_date = relationship("DimDate", foreign_keys=[order_date_id], back_populates="order_dates")
     ship_date = relationship("DimDate", foreign_keys=[ship_date_id], back_populates="ship_dates")
     
+    __table_args__ = (
+        # Covers sales by date and product: the measures ride along in the
+        # index, so those aggregations can run as index-only scans
+        Index(
+            "ix_fact_date_product_covering", "order_date_id", "product_sk",
+            postgresql_include=["sales", "quantity", "profit"]
+        ),
+    )
+    
     def __repr__(self):
         return f"<Sale {self.order_id}>"
     
+
+
+class IngestedSource(Base):
+    """Source file versions whose load has been committed to this database"""
+    __tablename__ = "ingested_source"
+    
+    # path, modification time and size of the source file (see scripts/pipeline.py)
+    fingerprint = Column(String, primary_key=True)
+    loaded_at = Column(DateTime, server_default=func.now())
+    
+    def __repr__(self):
+        return f"<IngestedSource {self.fingerprint}>"
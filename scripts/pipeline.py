@@ -1,6 +1,8 @@
 import os
 import logging
 import time
+import queue
+import threading
 import schedule
 from datetime import datetime
 from dotenv import load_dotenv
@@ -9,18 +11,88 @@ from loguru import logger
 from etl.ingestion import DataIngestion
 from etl.transforming import DataTransformation
 from etl.loading import DataLoading
+from config.logging import configure_logging
 
 # Load environment variables
 load_dotenv()
 
+# Rows per chunk for streaming ETL; 0 processes the whole file in memory at once
+CHUNK_ROWS = int(os.getenv("INGESTION_CHUNK_ROWS", "0"))
+
+# Maximum rows per fact_sales insert statement
+LOAD_BATCH_SIZE = int(os.getenv("LOAD_BATCH_SIZE", "20000"))
+
 # Create necessary directories
 
-os.makedirs("logs", exist_ok=True)
 os.makedirs("data/raw", exist_ok=True)
 os.makedirs("data/processed", exist_ok=True)
 
-# Add logger to create and rotate logs
-logger.add("logs/pipeline.logs", rotation="500 KB", level="INFO", format="{time} - {name} - {level} = {message}")
+# Add the rotating log file sinks (once per process)
+configure_logging()
+
+# Chunks each streaming stage may run ahead of the stage consuming them. Both
+# ingestion and transformation are buffered, so a streaming run holds up to
+# twice this many chunks plus the ones each stage is working on: together with
+# INGESTION_CHUNK_ROWS, this bounds its memory
+STAGE_BUFFER_CHUNKS = 2
+
+def _source_fingerprint(source_path):
+    """
+    Identifies the current version of the source file by path, modification
+    time and size, without reading it; None if it cannot be stat'ed
+    """
+    try:
+        stat = os.stat(source_path)
+    except (OSError, TypeError):
+        return None
+    return f"{os.path.abspath(source_path)}:{stat.st_mtime_ns}:{stat.st_size}"
+
+def _run_ahead(items, maxsize=STAGE_BUFFER_CHUNKS):
+    """
+    Pulls items from an iterator on a background thread into a bounded queue,
+    so the stage producing them overlaps with the stage consuming them
+    An error raised by the producer is re-raised to the consumer; if the
+    consumer stops early, the producer is stopped and closed too
+    """
+    buffer = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+    
+    def put(entry):
+        while not stop.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def produce():
+        try:
+            for item in items:
+                if not put(("item", item)):
+                    break
+            else:
+                put(("end", None))
+        except Exception as e:
+            put(("error", e))
+        finally:
+            close = getattr(items, "close", None)
+            if close is not None:
+                close()
+    
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            kind, value = buffer.get()
+            if kind == "end":
+                return
+            if kind == "error":
+                raise value
+            yield value
+    finally:
+        stop.set()
+        producer.join()
 
 def run_pipeline():
     """
@@ -29,8 +101,23 @@ def run_pipeline():
     start_time = time.time()
     logger.info("Starting ETL pipeline execution")
     
-    # Step 1: Ingestion
+    # Scheduled runs mostly see the same file again; skip all three steps when
+    # the target database already holds this version of it
     ingestion = DataIngestion()
+    loading = DataLoading()
+    fingerprint = _source_fingerprint(ingestion.source_path)
+    if fingerprint is not None and loading.source_loaded(fingerprint):
+        logger.info(f"Source {ingestion.source_path} already loaded into the database, skipping")
+        return True
+    
+    if CHUNK_ROWS > 0:
+        success = run_streaming_pipeline(CHUNK_ROWS, source_fingerprint=fingerprint)
+        if success:
+            execution_time = time.time() - start_time
+            logger.info(f"Pipeline executed successfully in {execution_time:.2f} seconds")
+        return success
+    
+    # Step 1: Ingestion
     df = ingestion.run_ingestion()
     
     if df is None:
@@ -46,8 +133,7 @@ def run_pipeline():
         return False
     
     # Step 3: Loading
-    loading = DataLoading()
-    success = loading.run_loading(dimensional_data)
+    success = loading.run_loading(dimensional_data, batch_size=LOAD_BATCH_SIZE, source_fingerprint=fingerprint)
     
     if not success:
         logger.error("Pipeline failed at loading step")
@@ -60,6 +146,38 @@ def run_pipeline():
     return True
 
 
+def run_streaming_pipeline(chunk_rows, source_fingerprint=None):
+    """
+    Executes the ETL pipeline chunk by chunk, with the stages overlapped:
+    while chunk N is loaded, chunk N+1 is transformed and chunk N+2 is read
+    """
+    logger.info(f"Running streaming pipeline in chunks of {chunk_rows} rows")
+    
+    ingestion = DataIngestion()
+    chunks = ingestion.run_ingestion(chunk_rows=chunk_rows)
+    
+    if chunks is None:
+        logger.error("Pipeline failed at ingestion step")
+        return False
+    
+    transformation = DataTransformation()
+    dimensional_chunks = _run_ahead(transformation.iter_transformation(_run_ahead(chunks)))
+    
+    # Ingestion and transformation each run on their own thread, a few chunks
+    # ahead of the loader; pandas, pyarrow and psycopg2 release the GIL in
+    # their heavy lifting, so the stages genuinely overlap
+    loading = DataLoading()
+    success = loading.run_streaming_loading(
+        dimensional_chunks, batch_size=LOAD_BATCH_SIZE, source_fingerprint=source_fingerprint
+    )
+    
+    if not success:
+        logger.error("Streaming pipeline failed")
+        return False
+    
+    return True
+
+
 def schedule_pipeline():
     """
     Schedules the pipeline to run at the specified interval
@@ -76,10 +194,13 @@ def schedule_pipeline():
     logger.info("Running pipeline immediately for initial load")
     run_pipeline()
     
-    # Keep the script running to execute scheduled jobs
+    # Keep the script running to execute scheduled jobs, sleeping straight
+    # through to the next due run instead of waking up every second
     while True:
+        idle_seconds = schedule.idle_seconds()
+        if idle_seconds > 0:
+            time.sleep(idle_seconds)
         schedule.run_pending()
-        time.sleep(1)
 
 
 if __name__ == "__main__":